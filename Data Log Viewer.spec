@@ -9,7 +9,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # datalog.logfile only imports these when they are available, so make sure they are bundled.
+    hiddenimports=['numba', 'llvmlite'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
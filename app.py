@@ -6,13 +6,6 @@ import sys
 import threading
 import traceback
 
-from matplotlib import gridspec
-from matplotlib.backends.backend_qtagg import (
-    FigureCanvas,
-    NavigationToolbar2QT as NavigationToolbar,
-)
-from matplotlib.figure import Figure
-import numpy as np
 from PyQt6.QtWidgets import (
     QApplication,
     QFileDialog,
@@ -20,6 +13,7 @@ from PyQt6.QtWidgets import (
     QLineEdit,
     QMainWindow,
     QMessageBox,
+    QProgressDialog,
     QPushButton,
     QSplitter,
     QTreeWidget,
@@ -27,10 +21,29 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-from PyQt6.QtCore import Qt, QAbstractItemModel, QModelIndex, QEvent, pyqtSignal, QTimer
+from PyQt6.QtCore import (
+    Qt,
+    QAbstractItemModel,
+    QModelIndex,
+    QEvent,
+    QObject,
+    QRunnable,
+    QThreadPool,
+    pyqtSignal,
+    QTimer,
+)
 from PyQt6.QtGui import QAction, QKeySequence
 
+# Log files are loaded on a thread pool thread. Once a parallel Numba kernel has run there, the TBB threading layer keeps
+# the process from exiting, so prefer the other layers unless the user chose otherwise. This has to be set before Numba
+# is imported.
+os.environ.setdefault('NUMBA_THREADING_LAYER_PRIORITY', 'omp workqueue tbb')
+
 from datalog.logfile import LogFile
+from graph import GRAPH_BACKENDS
+
+# Item data role holding the lowercased name that the filter box matches against.
+NAME_LOWER_ROLE = Qt.ItemDataRole.UserRole + 1
 
 
 class Application(QApplication):
@@ -43,14 +56,37 @@ class Application(QApplication):
         return super().event(event)
 
 
+class LoadSignals(QObject):
+    finished = pyqtSignal(LogFile)
+    error = pyqtSignal(str)
+
+
+class LoadLogFileTask(QRunnable):
+    """Loads a log file on a thread pool thread so the UI stays responsive."""
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self.signals = LoadSignals()
+
+    def run(self):
+        try:
+            log_file = LogFile(self.filename, precision=os.environ.get('DATA_LOG_VIEWER_PRECISION', 'f8'))
+        except:
+            self.signals.error.emit(traceback.format_exc())
+            return
+        self.signals.finished.emit(log_file)
+
+
 class MainWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
 
         self._log_file = None
-        self._is_graph_empty = True
         self._last_open_dir = None
+        self._load_generation = 0
+        self._load_progress_dialog = None
 
         file_menu = self.menuBar().addMenu('File')
         open_action = QAction('Open Data Log File', self)
@@ -68,23 +104,17 @@ class MainWindow(QMainWindow):
         browser_layout = QVBoxLayout(browser_widget)
         browser_layout.setContentsMargins(11, 11, 2, 11)
 
-        browser_layout.addWidget(self.create_filter_line_widget())
+        self._filter_line = self.create_filter_line_widget()
+        browser_layout.addWidget(self._filter_line)
         self._tree_widget = self.create_tree_widget()
         browser_layout.addWidget(self._tree_widget)
         browser_layout.addWidget(self.create_add_subplot_button())
         browser_layout.addWidget(self.create_clear_button())
         splitter.addWidget(browser_widget)
 
-        self._num_subplots = 1
-        self._figure = Figure(figsize=(5, 3))
         open_shortcut_text = open_shortcut.toString(format=QKeySequence.SequenceFormat.NativeText)
-        self._figure.suptitle(f'Drag and drop .wpilog file or {open_shortcut_text} to browse')
-        self._figure.set_tight_layout(True)
-        self._canvas = FigureCanvas(self._figure)
-        self._axs = [self._figure.subplots(sharex=True)]
-        self._toolbar = NavigationToolbar(self._canvas)
-
-        splitter.addWidget(self.create_graph_widget(self._toolbar, self._canvas))
+        self._graph = self.create_graph(f'Drag and drop .wpilog file or {open_shortcut_text} to browse')
+        splitter.addWidget(self._graph.widget)
 
         self.setCentralWidget(splitter)
 
@@ -115,20 +145,49 @@ class MainWindow(QMainWindow):
         self.load_log_file(filename)
 
     def load_log_file(self, filename):
-        try:
-            self._log_file = LogFile(filename)
-        except:
-            self.show_exception_dialog('Error loading data log file')
+        # A file opened while another is still loading replaces it, and the older load's results are ignored.
+        self._load_generation += 1
+        if self._load_progress_dialog is not None:
+            self._load_progress_dialog.close()
+
+        self._load_progress_dialog = QProgressDialog(f'Loading {os.path.basename(filename)}...', None, 0, 0, self)
+        self._load_progress_dialog.setWindowTitle('Data Log Viewer')
+        self._load_progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self._load_progress_dialog.show()
+
+        task = LoadLogFileTask(filename)
+        task.signals.finished.connect(partial(self.on_log_file_loaded, self._load_generation, filename))
+        task.signals.error.connect(partial(self.on_log_file_load_error, self._load_generation))
+        QThreadPool.globalInstance().start(task)
+
+    def on_log_file_loaded(self, generation, filename, log_file):
+        if generation != self._load_generation:
+            return
 
-        self._figure.suptitle(os.path.basename(filename))
+        self._load_progress_dialog.close()
+        self._log_file = log_file
+        self._graph.set_title(os.path.basename(filename))
         self._last_open_dir = os.path.dirname(filename)
         self.render_tree_widget()
         self.clear_graph()
 
+    def on_log_file_load_error(self, generation, details):
+        if generation != self._load_generation:
+            return
+
+        self._load_progress_dialog.close()
+        self.show_exception_dialog('Error loading data log file', details)
+
     def create_filter_line_widget(self):
         filter_line = QLineEdit()
         filter_line.setPlaceholderText('Filter')
-        filter_line.textChanged.connect(self.render_tree_widget)
+
+        # Wait for a pause in typing so a burst of keystrokes only runs one pass of hiding and showing tree items.
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(150)
+        self._filter_timer.timeout.connect(lambda: self.filter_tree_widget(filter_line.text()))
+        filter_line.textChanged.connect(lambda _: self._filter_timer.start())
 
         return filter_line
 
@@ -142,22 +201,38 @@ class MainWindow(QMainWindow):
 
         return tree
 
-    def render_tree_widget(self, filter_pattern=''):
+    def render_tree_widget(self):
         if self._log_file is None:
             return
 
+        # Hold off repainting until the whole tree is in place.
+        self._tree_widget.setUpdatesEnabled(False)
         self._tree_widget.clear()
         entry_tree = self._log_file.get_entry_tree()
-        root_item = self.tree_widget_item_from_entry_tree_node(entry_tree, filter_pattern=filter_pattern)
-        if root_item is None:
-            return
-
-        children = root_item.takeChildren()
-        for item in children:
-            self._tree_widget.addTopLevelItem(item)
-
+        root_item = self.tree_widget_item_from_entry_tree_node(entry_tree)
+        self._tree_widget.addTopLevelItems(root_item.takeChildren())
         self._tree_widget.sortItems(0, Qt.SortOrder.AscendingOrder)
         self._tree_widget.expandAll()
+        self._tree_widget.setUpdatesEnabled(True)
+
+        self.filter_tree_widget(self._filter_line.text())
+
+    def filter_tree_widget(self, filter_pattern):
+        pattern_lower = filter_pattern.lower()
+        self._tree_widget.setUpdatesEnabled(False)
+        for i in range(self._tree_widget.topLevelItemCount()):
+            self.filter_tree_widget_item(self._tree_widget.topLevelItem(i), pattern_lower)
+        self._tree_widget.setUpdatesEnabled(True)
+
+    def filter_tree_widget_item(self, item, pattern_lower, force_include=False):
+        force_include = force_include or pattern_lower in item.data(0, NAME_LOWER_ROLE)
+
+        visible = force_include
+        for i in range(item.childCount()):
+            visible = self.filter_tree_widget_item(item.child(i), pattern_lower, force_include) or visible
+
+        item.setHidden(not visible)
+        return visible
 
     def create_clear_button(self):
         button = QPushButton('Clear Graph')
@@ -171,28 +246,20 @@ class MainWindow(QMainWindow):
 
         return button
 
-    def create_graph_widget(self, toolbar, canvas):
-        graph_widget = QWidget()
-        graph_layout = QVBoxLayout(graph_widget)
-        graph_layout.setContentsMargins(2, 0, 0, 0)
-        graph_layout.setSpacing(0)
+    def create_graph(self, title):
+        backend = GRAPH_BACKENDS[os.environ.get('DATA_LOG_VIEWER_GRAPH_BACKEND', 'pyqtgraph')]
 
-        graph_layout.addWidget(toolbar)
-        graph_layout.addWidget(canvas)
+        return backend(title)
 
-        return graph_widget
-
-    def tree_widget_item_from_entry_tree_node(self, tree_node, filter_pattern='', force_include=False):
+    def tree_widget_item_from_entry_tree_node(self, tree_node):
         item = QTreeWidgetItem()
         item.setText(0, tree_node.prefix)
-
-        force_include = force_include or filter_pattern.lower() in tree_node.prefix.lower()
+        item.setData(0, NAME_LOWER_ROLE, tree_node.prefix_lower)
 
         for prefix, entry in tree_node.entries.items():
-            if not force_include and filter_pattern.lower() not in prefix.lower():
-                continue
             child = QTreeWidgetItem()
             child.setText(0, prefix)
+            child.setData(0, NAME_LOWER_ROLE, tree_node.entry_names_lower[prefix])
             child.setText(1, entry.type)
             child.setText(2, '{:,}'.format(self._log_file.get_record_count(entry.entry)))
             child.setData(0, Qt.ItemDataRole.UserRole, entry.entry)
@@ -201,14 +268,9 @@ class MainWindow(QMainWindow):
             item.addChild(child)
 
         for child_node in tree_node.children.values():
-            child = self.tree_widget_item_from_entry_tree_node(
-                child_node, filter_pattern=filter_pattern, force_include=force_include)
-            if force_include or child is not None:
-                item.addChild(child)
+            item.addChild(self.tree_widget_item_from_entry_tree_node(child_node))
 
-        if item.childCount() > 0:
-            return item
-        return None
+        return item
 
     def plot_series(self, item, column):
         if item.isDisabled() or item.data(0, Qt.ItemDataRole.UserRole) is None:
@@ -218,54 +280,30 @@ class MainWindow(QMainWindow):
             entry_id = item.data(0, Qt.ItemDataRole.UserRole)
             entry = self._log_file.get_entry(entry_id)
             name = entry.name
-            series = self._log_file.get_series(entry_id)
-            ax = self._axs[-1]
-            if '[]' in entry.type:
-                for i in range(len(series[0])):
-                    np_series = np.array([[record[0], record[1][i]] for record in series])
-                    ax.step(np_series[:, 0], np_series[:, 1], where='post', label=f'{name}[{i}]')
-            else:
-                np_series = np.array(series)
-                ax.step(np_series[:, 0], np_series[:, 1], where='post', label=name)
-            ax.legend()
-            ax.autoscale()
-            self._toolbar.update()
-            self._is_graph_empty = False
-            self._canvas.draw()
+            _, values = self._log_file.get_series(entry_id)
+            columns = range(values.shape[1]) if values.ndim == 2 else [None]
+            for i in columns:
+                label = name if i is None else f'{name}[{i}]'
+                self._graph.step(self._log_file, entry_id, i, label)
+            self._graph.autoscale()
+            self._graph.draw()
         except:
             self.show_exception_dialog('Error adding series to graph')
 
-    def retile_subplots(self):
-        gs = gridspec.GridSpec(len(self._axs), 1)
-        for i, ax in enumerate(self._axs):
-            ax.set_position(gs[i].get_position(self._figure))
-            ax.set_subplotspec(gs[i])
-        self._toolbar.update()
-
     def add_subplot(self):
-        ax = self._figure.add_subplot(len(self._axs) + 1, 1, 1, sharex=self._axs[0])
-        self._axs.append(ax)
-        self.retile_subplots()
-        if not self._is_graph_empty:
-            for ax in self._axs:
-                ax.autoscale()
-        self._canvas.draw()
+        self._graph.add_subplot()
+        self._graph.draw()
 
     def clear_graph(self):
-        for i, ax in enumerate(self._axs[1:], 1):
-            self._figure.delaxes(ax)
-        del self._axs[1:]
-        self._axs[0].clear()
-        self.retile_subplots()
-        self._is_graph_empty = True
-        self._canvas.draw()
-
-    def show_exception_dialog(self, text):
+        self._graph.clear()
+        self._graph.draw()
+
+    def show_exception_dialog(self, text, details=None):
         dialog = QMessageBox()
         dialog.setIcon(QMessageBox.Icon.Critical)
         dialog.setWindowTitle('Error')
         dialog.setText(text)
-        dialog.setInformativeText(traceback.format_exc())
+        dialog.setInformativeText(details if details is not None else traceback.format_exc())
         dialog.exec()
 
 
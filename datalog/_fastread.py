@@ -0,0 +1,159 @@
+import sys
+import threading
+
+import numba
+import numpy as np
+
+# Numba caches compiled kernels next to the module's source file, which a PyInstaller bundle does not have.
+_CACHE = not getattr(sys, 'frozen', False)
+
+
+@numba.njit(cache=_CACHE, nogil=True)
+def _read_varint(buf, pos, size):
+    val = np.uint64(0)
+    for i in range(size):
+        val |= np.uint64(buf[pos + i]) << np.uint64(8 * i)
+    return val
+
+
+@numba.njit(cache=_CACHE, nogil=True)
+def _read_header(buf, pos):
+    """Reads the header of the record at pos.
+
+    Returns (entry, timestamp, payload offset, payload size). The payload offset is -1 if buf ends before the record
+    does.
+    """
+    if len(buf) < pos + 4:
+        return 0, np.uint64(0), -1, 0
+    entry_len = (buf[pos] & 0x3) + 1
+    size_len = ((buf[pos] >> 2) & 0x3) + 1
+    timestamp_len = ((buf[pos] >> 4) & 0x7) + 1
+    header_len = 1 + entry_len + size_len + timestamp_len
+    if len(buf) < pos + header_len:
+        return 0, np.uint64(0), -1, 0
+    entry = np.int64(_read_varint(buf, pos + 1, entry_len))
+    size = np.int64(_read_varint(buf, pos + 1 + entry_len, size_len))
+    timestamp = _read_varint(buf, pos + 1 + entry_len + size_len, timestamp_len)
+    if len(buf) < pos + header_len + size:
+        return 0, np.uint64(0), -1, 0
+    return entry, timestamp, pos + header_len, size
+
+
+@numba.njit(cache=_CACHE, nogil=True)
+def read_entries(buf, pos):
+    """Reads the entry ID of every record starting at pos, looking at nothing but the record headers."""
+    entries = np.empty(1024, dtype=np.int64)
+    n = 0
+    while True:
+        entry, _, offset, size = _read_header(buf, pos)
+        if offset < 0:
+            break
+        if n == len(entries):
+            grown = np.empty(2 * n, dtype=np.int64)
+            grown[:n] = entries
+            entries = grown
+        entries[n] = entry
+        n += 1
+        pos = offset + size
+    return entries[:n]
+
+
+def number_entries(entries):
+    """Numbers the entry IDs in entries densely, since they can be anything up to 2**32 - 1.
+
+    Returns (entry_ids, indices): entry_ids holds the distinct IDs in increasing order, and indices[i] is the position
+    of entries[i] in entry_ids.
+    """
+    top = entries.max(initial=0)
+    if top > 2 * len(entries) + 1024:
+        return np.unique(entries, return_inverse=True)
+    # Looking IDs up in a table is quicker than sorting them, and the table is no bigger than entries.
+    present = np.zeros(top + 1, dtype=np.bool_)
+    present[entries] = True
+    entry_ids = np.flatnonzero(present)
+    table = np.zeros(top + 1, dtype=np.int64)
+    table[entry_ids] = np.arange(len(entry_ids))
+    return entry_ids, table[entries]
+
+
+@numba.njit(cache=_CACHE, nogil=True)
+def scan_records(buf, pos, indices, counts):
+    """Walks the record headers starting at pos without decoding any payloads.
+
+    indices and counts give each record's entry number and the number of records of each entry. Returns (starts,
+    record_numbers, timestamps, offsets, sizes): the records of entry number k are at [starts[k], starts[k + 1]) of
+    the other arrays, in file order. record_numbers gives each record's position in the file, and offsets and sizes
+    locate its payload in buf.
+    """
+    starts = np.zeros(len(counts) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum(counts)
+    n = starts[-1]
+    record_numbers = np.empty(n, dtype=np.int64)
+    timestamps = np.empty(n, dtype=np.uint64)
+    offsets = np.empty(n, dtype=np.int64)
+    sizes = np.empty(n, dtype=np.int64)
+    cursors = starts[:-1].copy()
+    for record_number in range(n):
+        _, timestamp, offset, size = _read_header(buf, pos)
+        i = cursors[indices[record_number]]
+        cursors[indices[record_number]] += 1
+        record_numbers[i] = record_number
+        timestamps[i] = timestamp
+        offsets[i] = offset
+        sizes[i] = size
+        pos = offset + size
+    return starts, record_numbers, timestamps, offsets, sizes
+
+
+# Type codes for decode_scalars. 0 means an entry is skipped.
+DOUBLE = 1
+INT64 = 2
+BOOLEAN = 3
+
+
+# Records are decoded in chunks of this many so the work can be split evenly between threads.
+_CHUNK_SIZE = 1 << 14
+
+
+@numba.njit(cache=_CACHE, nogil=True, parallel=True)
+def _decode_scalars(buf, offsets, starts, type_codes, firsts, out):
+    """Decodes the records of each entry number e from firsts[e] up to starts[e + 1] by its type code in type_codes.
+
+    out[i] is set to the payload of record i as int64, which for a double is its bit pattern and for a boolean is 0 or
+    1. The records are split into chunks regardless of which entry they belong to, so a log that is mostly one entry
+    still gets decoded on every thread.
+    """
+    n = len(offsets)
+    for chunk in numba.prange((n + _CHUNK_SIZE - 1) // _CHUNK_SIZE):
+        first = chunk * _CHUNK_SIZE
+        e = np.searchsorted(starts, first, side='right') - 1
+        for i in range(first, min(first + _CHUNK_SIZE, n)):
+            while i >= starts[e + 1]:
+                e += 1
+            type_code = type_codes[e]
+            if i >= firsts[e]:
+                if type_code == DOUBLE or type_code == INT64:
+                    out[i] = buf[offsets[i]:offsets[i] + 8].view(np.int64)[0]
+                elif type_code == BOOLEAN:
+                    out[i] = buf[offsets[i]] != 0
+
+
+# The workqueue threading layer is not thread-safe and aborts the process if two threads launch parallel kernels at
+# once, so launches are serialized.
+_launch_lock = threading.Lock()
+
+
+def decode_scalars(buf, offsets, starts, type_codes, firsts, out):
+    """See _decode_scalars. Safe to call from several threads."""
+    with _launch_lock:
+        _decode_scalars(buf, offsets, starts, type_codes, firsts, out)
+
+
+def read_records(buf, pos):
+    """Reads the header of every record starting at pos.
+
+    Returns entry_ids from number_entries followed by the arrays from scan_records, so the records of entry
+    entry_ids[k] are at [starts[k], starts[k + 1]).
+    """
+    entry_ids, indices = number_entries(read_entries(buf, pos))
+    return (entry_ids,) + scan_records(buf, pos, indices, np.bincount(indices, minlength=len(entry_ids)))
@@ -0,0 +1,90 @@
+from array import array
+import struct
+
+import numpy as np
+
+_UNPACK_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+def _header_layout(header):
+    entry_len = (header & 0x3) + 1
+    size_len = ((header >> 2) & 0x3) + 1
+    timestamp_len = ((header >> 4) & 0x7) + 1
+    header_len = 1 + entry_len + size_len + timestamp_len
+    try:
+        # Most headers only use 1, 2, 4 or 8 byte fields, which a single Struct call can read all at once.
+        header_struct = struct.Struct('<x' + ''.join(_UNPACK_CODES[n] for n in (entry_len, size_len, timestamp_len)))
+    except KeyError:
+        header_struct = None
+    return header_struct, entry_len, size_len, timestamp_len, header_len
+
+
+# Indexed by the first byte of a record header.
+_HEADER_LAYOUTS = [_header_layout(header) for header in range(256)]
+
+
+def read_records(buf, pos):
+    """Pure Python version of _fastread.read_records, used when Numba is not installed.
+
+    Returns (entry_ids, starts, record_numbers, timestamps, offsets, sizes): the records of entry entry_ids[k] are at
+    [starts[k], starts[k + 1]) of the other arrays, in file order. record_numbers gives each record's position in the
+    file, and offsets and sizes locate its payload in buf.
+    """
+    data = memoryview(buf)
+    end = len(data)
+    from_bytes = int.from_bytes
+    entry_ids = array('q')
+    timestamps = array('Q')
+    offsets = array('q')
+    sizes = array('q')
+    while end >= pos + 4:
+        header_struct, entry_len, size_len, timestamp_len, header_len = _HEADER_LAYOUTS[data[pos]]
+        if end < pos + header_len:
+            break
+        if header_struct is not None:
+            entry, size, timestamp = header_struct.unpack_from(data, pos)
+        else:
+            size_pos = pos + 1 + entry_len
+            timestamp_pos = size_pos + size_len
+            entry = from_bytes(data[pos + 1:size_pos], 'little')
+            size = from_bytes(data[size_pos:timestamp_pos], 'little')
+            timestamp = from_bytes(data[timestamp_pos:timestamp_pos + timestamp_len], 'little')
+        pos += header_len
+        if end < pos + size:
+            break
+        entry_ids.append(entry)
+        timestamps.append(timestamp)
+        offsets.append(pos)
+        sizes.append(size)
+        pos += size
+
+    entries = np.frombuffer(entry_ids, dtype=np.int64)
+    record_numbers = np.argsort(entries, kind='stable')
+    # Entry IDs can be anything up to 2**32 - 1, so only count the ones that are used.
+    entry_ids, counts = np.unique(entries, return_counts=True)
+    starts = np.zeros(len(entry_ids) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum(counts)
+    return (
+        entry_ids,
+        starts,
+        record_numbers,
+        np.frombuffer(timestamps, dtype=np.uint64)[record_numbers],
+        np.frombuffer(offsets, dtype=np.int64)[record_numbers],
+        np.frombuffer(sizes, dtype=np.int64)[record_numbers],
+    )
+
+
+# Type codes for decode_scalars. 0 means an entry is skipped.
+DOUBLE = 1
+INT64 = 2
+BOOLEAN = 3
+
+
+def decode_scalars(buf, offsets, starts, type_codes, firsts, out):
+    """NumPy version of _fastread.decode_scalars."""
+    for e in np.flatnonzero(type_codes):
+        records = slice(firsts[e], starts[e + 1])
+        if type_codes[e] == BOOLEAN:
+            out[records] = buf[offsets[records]] != 0
+        else:
+            out[records] = buf[offsets[records, np.newaxis] + np.arange(8)].view('<i8').reshape(-1)
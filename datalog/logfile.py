@@ -1,118 +1,309 @@
-from collections import defaultdict
-from copy import copy
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime
 import mmap
 from operator import attrgetter
 from typing import List, Optional, Dict
 
+import numpy as np
+
 from datalog import datalog
 
+try:
+    from datalog import _fastread as _reader
+except ImportError:
+    # Numba is optional; without it records are read by plain Python and decoded with NumPy.
+    from datalog import _rawread as _reader
+
 @dataclass
 class TreeNode:
     prefix: str
     entries: Optional[Dict[str, datalog.StartRecordData]] = None
-    children: Optional[Dict[str, str]] = None
+    children: Optional[Dict[str, 'TreeNode']] = None
+    # Lowercased prefix and entry names, for case-insensitive filtering.
+    prefix_lower: str = ''
+    entry_names_lower: Optional[Dict[str, str]] = None
+
+
+# Inexplicably large timestamps like 18446744069177.88 s appear at the beginning of some log files. Since they only
+# seem to appear there, timestamps past this many microseconds are treated as zero.
+_MAX_TIMESTAMP_US = 10 ** 15
+
+
+def _to_timedelta(timestamps):
+    return np.where(timestamps > _MAX_TIMESTAMP_US, 0, timestamps).astype('timedelta64[us]')
+
+
+# Series end with a copy of their last value at the end of the log, so step plots extend all the way across. Both
+# helpers fill one buffer with room for it rather than concatenating.
+
+def _series_times(start, timestamps, end):
+    out = np.empty(len(timestamps) + 1, dtype='datetime64[us]')
+    np.add(start, _to_timedelta(timestamps), out=out[:-1])
+    out[-1] = end
+    return out
+
+
+def _series_values(values, dtype=None):
+    out = np.empty((len(values) + 1,) + values.shape[1:], dtype=dtype or values.dtype)
+    out[:-1] = values
+    out[-1] = values[-1]
+    return out
+
+
+def _check_sizes(sizes, width, type_name):
+    if np.any(sizes != width):
+        raise TypeError(f'not a {type_name}')
+
+
+def _gather(buf, offsets, sizes, width, type_name):
+    _check_sizes(sizes, width, type_name)
+    return buf[offsets[:, np.newaxis] + np.arange(width)]
+
+
+def _array_decoder(dtype, convert):
+    dtype = np.dtype(dtype)
+
+    def decode(buf, offsets, sizes):
+        if np.any(sizes % dtype.itemsize != 0):
+            raise TypeError(f'not a {dtype} array')
+        width = int(sizes.max(initial=0))
+        if np.all(sizes == width):
+            return convert(_gather(buf, offsets, sizes, width, 'array'))
+        # Arrays of varying length are padded with NaN out to the longest one.
+        values = np.full((len(offsets), width // dtype.itemsize), np.nan)
+        for i, (offset, size) in enumerate(zip(offsets, sizes)):
+            values[i, :size // dtype.itemsize] = convert(buf[offset:offset + size])
+        return values
+
+    return decode
+
+
+def _object_decoder(getter):
+    def decode(buf, offsets, sizes):
+        values = np.empty(len(offsets), dtype=object)
+        for i, (offset, size) in enumerate(zip(offsets, sizes)):
+            values[i] = getter(datalog.DataLogRecord(1, 0, buf[offset:offset + size].tobytes()))
+        return values
+
+    return decode
+
+
+# Decoders for the types that are not in _SCALAR_TYPES, called with the offsets and sizes of one entry's records.
+_DECODERS = {
+    'string': _object_decoder(datalog.DataLogRecord.getString),
+    'json': _object_decoder(datalog.DataLogRecord.getString),
+    'boolean[]': _array_decoder(np.uint8, lambda raw: raw != 0),
+    'double[]': _array_decoder('<f8', lambda raw: raw.view('<f8')),
+    'float[]': _array_decoder('<f4', lambda raw: raw.view('<f4')),
+    'int64[]': _array_decoder('<i8', lambda raw: raw.view('<i8')),
+    'string[]': _object_decoder(datalog.DataLogRecord.getStringArray),
+}
+
+
+def _split_entry_name(name):
+    # Only the first ':' splits off a top-level prefix (e.g. 'NT:/...'), after which the name is split on '/'. Empty
+    # components from leading or repeated slashes are dropped, except for the last one.
+    prefix, separator, rest = name.lstrip('/').partition(':')
+    if not separator:
+        return [prefix]
+    parts = rest.lstrip('/').split('/')
+    if '' in parts[:-1]:
+        parts = [part for part in parts[:-1] if part] + parts[-1:]
+    return [prefix] + parts
+
+
+def _decimation_indices(values, n_target):
+    # Keep the minimum and maximum of each of about n_target bins, plus both endpoints, so spikes stay visible.
+    n = len(values)
+    if n <= 2 * n_target:
+        return np.arange(n)
+    bin_size = -(-n // n_target)
+    n_bins = n // bin_size
+    bins = values[:n_bins * bin_size].reshape(n_bins, bin_size)
+    bin_starts = np.arange(n_bins + 1) * bin_size
+    tail = values[n_bins * bin_size:]
+    mins = np.append(bins.argmin(axis=1), tail.argmin() if len(tail) else 0)
+    maxs = np.append(bins.argmax(axis=1), tail.argmax() if len(tail) else 0)
+    return np.unique(np.concatenate([[0, n - 1], bin_starts + mins, bin_starts + maxs]).clip(0, n - 1))
+
+
+def _map_file(f):
+    # Log files are read front to back exactly once, so fault every page in up front where the platform allows it
+    # (MAP_POPULATE is Linux-only) and otherwise tell the kernel to read ahead.
+    populate = getattr(mmap, 'MAP_POPULATE', None)
+    if populate is not None:
+        mm = mmap.mmap(f.fileno(), 0, flags=mmap.MAP_PRIVATE | populate, prot=mmap.PROT_READ)
+    else:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        mm.madvise(mmap.MADV_WILLNEED)
+    except AttributeError:
+        # madvise is not available on Windows.
+        pass
+    return mm
+
+
+# Types whose records all have the same size, mapped to their _reader type code, record size and error message. They
+# are decoded by a single _reader.decode_scalars call, which looks up each entry's type code by entry ID.
+_SCALAR_TYPES = {
+    'double': (_reader.DOUBLE, 8, 'double'),
+    'int64': (_reader.INT64, 8, 'integer'),
+    'boolean': (_reader.BOOLEAN, 1, 'boolean'),
+}
+
+
+def _to_tree_node(prefix, node):
+    children, entries = node
+    return TreeNode(
+        prefix=prefix,
+        entries=entries,
+        children={child_prefix: _to_tree_node(child_prefix, child) for child_prefix, child in children.items()},
+        prefix_lower=prefix.lower(),
+        entry_names_lower={name: name.lower() for name in entries},
+    )
+
+
+def _is_system_time(entry):
+    return entry.name == 'systemTime' and entry.type == 'int64'
 
 
 class LogFile:
 
-    def __init__(self, filename):
+    def __init__(self, filename, precision='f8'):
+        """precision is the NumPy dtype that double and double[] values are stored as: 'f8' keeps them exact and 'f4'
+        halves their memory use, which is plenty for plotting."""
+        if precision not in ('f4', 'f8'):
+            raise ValueError(f'unsupported precision {precision!r}')
         self.filename = filename
+        self.precision = precision
         self._entries = {}
         self._entry_series = {}
 
         self.load_file(self.filename)
+        self._record_counts = {
+            entry_id: max(len(timestamps) - 1, 0) for entry_id, (timestamps, _) in self._entry_series.items()}
 
     def load_file(self, filename):
-        latest_timestamp = 0
-        sync_timestamp = None
-        sync_datetime = None
         with open(filename) as f:
-            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mm = _map_file(f)
             reader = datalog.DataLogReader(mm)
             if not reader:
                 raise Exception('Invalid data log file')
-            for record in reader:
-                timestamp = record.timestamp / 1000000
-                latest_timestamp = timestamp
+
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            buf.flags.writeable = False
+            extra_header_size = int.from_bytes(mm[8:12], byteorder='little', signed=False)
+            entry_ids, starts, record_numbers, timestamps, offsets, sizes = _reader.read_records(
+                buf, 12 + extra_header_size)
+            # The records of each entry ID are found by its number in entry_ids.
+            entry_numbers = {int(entry_id): k for k, entry_id in enumerate(entry_ids)}
+
+            # Only the control records need to be looked at one by one. They belong to entry 0, so they come first.
+            start_record_numbers = {}
+            control_records = range(starts[0], starts[1]) if 0 in entry_numbers else range(0)
+            for i in control_records:
+                record = datalog.DataLogRecord(0, timestamps[i], mm[offsets[i]:offsets[i] + sizes[i]])
                 if record.isStart():
                     data = record.getStartData()
                     self._entries[data.entry] = data
-                    self._entry_series[data.entry] = []
-                elif record.isFinish():
-                    pass
-                elif record.isSetMetadata():
-                    pass
-                elif record.isControl():
-                    pass
+                    start_record_numbers[data.entry] = record_numbers[i]
+
+            entry_records = {}
+            for e, start_record_number in start_record_numbers.items():
+                if e not in entry_numbers:
+                    entry_records[e] = slice(0, 0)
+                    continue
+                first, last = starts[entry_numbers[e]], starts[entry_numbers[e] + 1]
+                # A restarted entry only keeps the records logged after its latest start record.
+                first += np.searchsorted(record_numbers[first:last], start_record_number)
+                entry_records[e] = slice(first, last)
+
+            # Entry numbers index these arrays directly. Entries that are not scalars keep type code 0 and are skipped.
+            type_codes = np.zeros(len(entry_ids), dtype=np.uint8)
+            firsts = np.zeros(len(entry_ids), dtype=np.int64)
+            for e, entry in self._entries.items():
+                records = entry_records[e]
+                if records.stop > records.start and entry.type in _SCALAR_TYPES:
+                    type_code, size, type_label = _SCALAR_TYPES[entry.type]
+                    _check_sizes(sizes[records], size, type_label)
+                    type_codes[entry_numbers[e]] = type_code
+                    firsts[entry_numbers[e]] = records.start
+
+            # Scalars are decoded to their raw 64 bits, or to 0 and 1 for booleans, at the position of their record.
+            raw_values = np.empty(len(offsets), dtype=np.int64)
+            _reader.decode_scalars(buf, offsets, starts, type_codes, firsts, raw_values)
+
+            # Sync to the last systemTime record in the file, whichever systemTime entry it belongs to.
+            sync_record = None
+            for e, entry in self._entries.items():
+                records = entry_records[e]
+                if _is_system_time(entry) and records.stop > records.start:
+                    last = records.stop - 1
+                    if sync_record is None or record_numbers[last] > record_numbers[sync_record]:
+                        sync_record = last
+
+            sync_timestamp = None
+            sync_datetime = None
+            if sync_record is not None:
+                sync_timestamp = int(timestamps[sync_record])
+                sync_datetime = datetime.fromtimestamp(raw_values[sync_record] / 1000000)
+
+            if sync_datetime is None:
+                # Without it there is nothing to line record timestamps up with wall-clock time.
+                raise Exception('Data log file has no systemTime records')
+            start = np.datetime64(sync_datetime, 'us') - np.timedelta64(sync_timestamp, 'us')
+            # The last record in the file is the last record of one of the entries.
+            last_records = starts[1:] - 1
+            end_record = last_records[np.argmax(record_numbers[last_records])]
+            end = start + _to_timedelta(timestamps[end_record:end_record + 1])[0]
+
+            for e, entry in self._entries.items():
+                records = entry_records[e]
+                if records.stop == records.start or _is_system_time(entry):
+                    values = None
+                elif entry.type == 'double':
+                    values, dtype = raw_values[records].view(np.float64), self.precision
+                elif entry.type == 'int64':
+                    values, dtype = raw_values[records], None
+                elif entry.type == 'boolean':
+                    values, dtype = raw_values[records], np.bool_
+                elif entry.type in _DECODERS:
+                    values = _DECODERS[entry.type](buf, offsets[records], sizes[records])
+                    dtype = self.precision if entry.type == 'double[]' else None
                 else:
-                    entry = self._entries[record.entry]
-                    if entry.name == 'systemTime' and entry.type == 'int64':
-                        dt = datetime.fromtimestamp(record.getInteger() / 1000000)
-                        sync_timestamp = timestamp
-                        sync_datetime = dt
-                        continue
-                    if entry.type == 'double':
-                        self._entry_series[record.entry].append([timestamp, record.getDouble()])
-                    elif entry.type == 'int64':
-                        self._entry_series[record.entry].append([timestamp, record.getInteger()])
-                    elif entry.type == 'string' or entry.type == 'json':
-                        self._entry_series[record.entry].append([timestamp, record.getString()])
-                    elif entry.type == 'boolean':
-                        self._entry_series[record.entry].append([timestamp, record.getBoolean()])
-                    elif entry.type == 'boolean[]':
-                        self._entry_series[record.entry].append([timestamp, record.getBooleanArray()])
-                    elif entry.type == 'double[]':
-                        self._entry_series[record.entry].append([timestamp, record.getDoubleArray()])
-                    elif entry.type == 'float[]':
-                        self._entry_series[record.entry].append([timestamp, record.getFloatArray()])
-                    elif entry.type == 'int64[]':
-                        self._entry_series[record.entry].append([timestamp, record.getIntegerArray()])
-                    elif entry.type == 'string[]':
-                        self._entry_series[record.entry].append([timestamp, record.getStringArray()])
-
-        start_datetime = sync_datetime - timedelta(seconds=sync_timestamp)
-
-        for e, s in self._entry_series.items():
-            if not s:
-                continue
-            s.append([latest_timestamp, s[-1][1]])
-            for record in s:
-                try:
-                    record[0] = start_datetime + timedelta(seconds=record[0])
-                except OverflowError:
-                    # Handle inexplicably large timestamps like 18446744069177.88. Since they only seem to appear at the
-                    # beginning of log files, just treat them as zero.
-                    record[0] = start_datetime
+                    values = None
+
+                if values is None:
+                    self._entry_series[e] = (np.empty(0, dtype='datetime64[us]'), np.empty(0))
+                else:
+                    self._entry_series[e] = (
+                        _series_times(start, timestamps[records], end),
+                        _series_values(values, dtype),
+                    )
+
+        self._entry_tree = self._get_entry_tree(self.list_entries())
 
     def list_entries(self):
         return sorted(self._entries.values(), key=attrgetter('name'))
 
-    def _get_entry_tree(self, this_prefix, entries, separator=':'):
-        leaf_nodes = {}
-        prefixes = defaultdict(list)
-
+    def _get_entry_tree(self, entries):
+        # Build the trie out of plain (children, entries) dict pairs first and only wrap it in TreeNodes at the end.
+        root = ({}, {})
         for entry in entries:
-            name = entry.name.lstrip('/')
-            try:
-                prefix, rest = name.split(separator, 1)
-            except ValueError:
-                leaf_nodes[name] = entry
-                continue
-            entry_copy = copy(entry)
-            entry_copy.name = rest
-            prefixes[prefix].append(entry_copy)
-
-        children = {}
-        for prefix, sub_entries in prefixes.items():
-            children[prefix] = self._get_entry_tree(prefix, sub_entries, separator='/')
-
-        return TreeNode(prefix=this_prefix, entries=leaf_nodes, children=children)
+            *prefixes, name = _split_entry_name(entry.name)
+            children, leaves = root
+            for prefix in prefixes:
+                node = children.get(prefix)
+                if node is None:
+                    node = children[prefix] = ({}, {})
+                children, leaves = node
+            leaves[name] = entry
+
+        return _to_tree_node('', root)
 
     def get_entry_tree(self):
-        entries = self.list_entries()
-        return self._get_entry_tree('', entries)
+        return self._entry_tree
 
     def get_entry(self, entry_id):
         return self._entries[entry_id]
@@ -120,5 +311,16 @@ class LogFile:
     def get_series(self, entry_id):
         return self._entry_series[entry_id]
 
+    def get_series_decimated(self, entry_id, n_target=4000, column=None, start=None, end=None):
+        timestamps, values = self.get_series(entry_id)
+        if column is not None:
+            values = values[:, column]
+
+        # Include the records on either side of [start, end] so the steps reach the edges of the range.
+        lo = 0 if start is None else max(np.searchsorted(timestamps, start, side='right') - 1, 0)
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='left') + 1
+        indices = lo + _decimation_indices(values[lo:hi], n_target)
+        return timestamps[indices], values[indices]
+
     def get_record_count(self, entry_id):
-        return max(len(self.get_series(entry_id)) - 1, 0)
+        return self._record_counts[entry_id]
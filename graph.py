@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+
+from matplotlib import dates, gridspec
+from matplotlib.backends.backend_qtagg import (
+    FigureCanvas,
+    NavigationToolbar2QT as NavigationToolbar,
+)
+from matplotlib.figure import Figure
+import numpy as np
+import pyqtgraph as pg
+from PyQt6.QtWidgets import QVBoxLayout, QWidget
+
+
+class GraphBackend(ABC):
+    """Draws step plots of log file series into vertically stacked subplots that share a time axis.
+
+    widget: The QWidget showing the graph.
+    """
+
+    @abstractmethod
+    def set_title(self, title):
+        pass
+
+    @abstractmethod
+    def add_subplot(self):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Removes every series and every subplot but the first."""
+
+    @abstractmethod
+    def step(self, log_file, entry_id, column, label):
+        """Adds a series to the last subplot. column selects one element of an array series."""
+
+    @abstractmethod
+    def autoscale(self):
+        pass
+
+    @abstractmethod
+    def draw(self):
+        pass
+
+
+class MatplotlibBackend(GraphBackend):
+
+    def __init__(self, title):
+        self._figure = Figure(figsize=(5, 3))
+        self._figure.suptitle(title)
+        self._figure.set_tight_layout(True)
+        self._canvas = FigureCanvas(self._figure)
+        self._axs = [self._figure.subplots(sharex=True)]
+        self._toolbar = NavigationToolbar(self._canvas)
+        self._is_empty = True
+        self._decimated_lines = {}
+
+        self.widget = QWidget()
+        layout = QVBoxLayout(self.widget)
+        layout.setContentsMargins(2, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self._toolbar)
+        layout.addWidget(self._canvas)
+
+    def set_title(self, title):
+        self._figure.suptitle(title)
+
+    def _retile_subplots(self):
+        gs = gridspec.GridSpec(len(self._axs), 1)
+        for i, ax in enumerate(self._axs):
+            ax.set_position(gs[i].get_position(self._figure))
+            ax.set_subplotspec(gs[i])
+        self._toolbar.update()
+
+    def add_subplot(self):
+        ax = self._figure.add_subplot(len(self._axs) + 1, 1, 1, sharex=self._axs[0])
+        self._axs.append(ax)
+        self._retile_subplots()
+        if not self._is_empty:
+            for ax in self._axs:
+                ax.autoscale()
+
+    def clear(self):
+        for ax in self._axs[1:]:
+            self._figure.delaxes(ax)
+        del self._axs[1:]
+        self._axs[0].clear()
+        self._decimated_lines = {}
+        self._retile_subplots()
+        self._is_empty = True
+
+    def step(self, log_file, entry_id, column, label):
+        ax = self._axs[-1]
+        timestamps, values = log_file.get_series_decimated(entry_id, column=column)
+        line, = ax.step(timestamps, values, where='post', label=label)
+        self._decimated_lines[line] = (log_file, entry_id, column)
+        ax.callbacks.connect('xlim_changed', self._redecimate_series)
+        ax.legend()
+        self._is_empty = False
+
+    def _redecimate_series(self, ax):
+        # Subplots sharing the x-axis are moved without firing their own xlim_changed, so update all of them.
+        start, end = (np.datetime64(dates.num2date(x).replace(tzinfo=None), 'us') for x in ax.get_xlim())
+        for subplot_ax in self._axs:
+            for line in subplot_ax.get_lines():
+                if line in self._decimated_lines:
+                    log_file, entry_id, column = self._decimated_lines[line]
+                    line.set_data(*log_file.get_series_decimated(entry_id, column=column, start=start, end=end))
+
+    def autoscale(self):
+        self._axs[-1].autoscale()
+        self._toolbar.update()
+
+    def draw(self):
+        self._canvas.draw()
+
+
+class PyQtGraphBackend(GraphBackend):
+
+    def __init__(self, title):
+        pg.setConfigOptions(antialias=False)
+        self.widget = pg.GraphicsLayoutWidget()
+        self._title = self.widget.addLabel(title, row=0, col=0)
+        self._plots = []
+        self.add_subplot()
+
+    def set_title(self, title):
+        self._title.setText(title)
+
+    def add_subplot(self):
+        # Timestamps are local wall-clock times, so show them as-is rather than shifting them to the local timezone.
+        plot = self.widget.addPlot(row=len(self._plots) + 1, col=0, axisItems={'bottom': pg.DateAxisItem(utcOffset=0)})
+        plot.addLegend()
+        plot.showGrid(x=True, y=True)
+        # Only draw the visible part of each series, reduced to its per-pixel min/max.
+        plot.setClipToView(True)
+        plot.setDownsampling(auto=True, mode='peak')
+        if self._plots:
+            plot.setXLink(self._plots[0])
+        self._plots.append(plot)
+
+    def clear(self):
+        for plot in self._plots[1:]:
+            self.widget.removeItem(plot)
+        del self._plots[1:]
+        self._plots[0].clear()
+
+    def step(self, log_file, entry_id, column, label):
+        plot = self._plots[-1]
+        timestamps, values = log_file.get_series(entry_id)
+        if column is not None:
+            values = values[:, column]
+        if values.dtype == np.bool_:
+            values = values.astype(np.float32)
+        seconds = (timestamps - np.datetime64(0, 'us')) / np.timedelta64(1, 's')
+        pen = pg.mkPen(pg.intColor(len(plot.listDataItems()), hues=10))
+        plot.plot(seconds, values, stepMode='right', connect='finite', pen=pen, name=label)
+
+    def autoscale(self):
+        self._plots[-1].enableAutoRange()
+
+    def draw(self):
+        # pyqtgraph repaints on its own whenever its items change.
+        pass
+
+
+GRAPH_BACKENDS = {
+    'pyqtgraph': PyQtGraphBackend,
+    'matplotlib': MatplotlibBackend,
+}